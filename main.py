@@ -1,23 +1,86 @@
 #!/usr/bin/env python3
 
 import argparse
+import atexit
+import collections
+import functools
+import json
 import os
 import re
+import secrets
 import sys
-import uuid
 import logging
-import requests
-import tfvars
+from typing import TYPE_CHECKING
+
+# requests, tfvars and the thread pool are imported where they are used so
+# that --help and argument errors don't pay for loading them.
+if TYPE_CHECKING:
+    import requests
 
 logging.basicConfig(level=logging.INFO)
 
-TFC_TOKEN = os.environ.get("TFC_TOKEN")
 TFC_ORG = os.environ.get("TFC_ORG")
 TFC_WORKSPACE = os.environ.get("TFC_WORKSPACE")
-HEADERS = {
-    "Authorization": f"Bearer {TFC_TOKEN}",
-    "Content-Type": "application/vnd.api+json",
-}
+_URL_RE = re.compile(r"^https?://.*?/api/v2")
+
+# Upper bound on in-flight variable uploads; also sizes the adapter pool so
+# every worker keeps its own connection alive through the burst.
+MAX_WORKERS = 8
+
+
+@functools.lru_cache(maxsize=1)
+def get_session() -> "requests.Session":
+    """
+    Shared HTTP session for Terraform API calls
+
+    Built on first use so the token is read and validated from the environment
+    at call time rather than import time. Rate limiting (429) and transient
+    server errors are retried with backoff instead of abandoning a partially
+    configured workspace; the final response is returned as-is so callers
+    still report the failure.
+
+    :return: Authenticated session with pooled, retrying adapters
+    :rtype: requests.Session
+    """
+    token = os.environ.get("TFC_TOKEN")
+
+    if not token:
+        logging.error("TFC_TOKEN environment variable not set")
+        sys.exit(1)
+
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    # read=0: a POST whose response was lost may already have been applied
+    # (e.g. a queued auto-apply run), so read errors and timeouts are never
+    # retried; only connection failures and 429/5xx responses re-send a POST.
+    retry = Retry(
+        total=5,
+        read=0,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "POST"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    # All calls go to a single host, so one pool with a slot per worker is enough.
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=MAX_WORKERS, max_retries=retry
+    )
+
+    session = requests.Session()
+    session.headers.update(
+        {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/vnd.api+json",
+        }
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    atexit.register(session.close)
+
+    return session
 
 
 def cli() -> argparse.Namespace:
@@ -40,15 +103,16 @@ def cli() -> argparse.Namespace:
         + "(https://app.terraform.io/api/v2)",
         default="https://app.terraform.io/api/v2",
     )
-    parser.add_argument(
+    workspace = parser.add_mutually_exclusive_group(required=True)
+    workspace.add_argument(
         "-w",
         "--workspace",
         help="Workspace name (required if not using prefix)",
     )
-    parser.add_argument(
+    workspace.add_argument(
         "-p",
         "--prefix",
-        help="Workspace prefix, will generate random UUID suffix "
+        help="Workspace prefix, will generate random hex suffix "
         + "(required if not using workspace)",
     )
 
@@ -80,8 +144,8 @@ def cli() -> argparse.Namespace:
         logging.error("The '--module' argument is required.")
         sys.exit(1)
 
-    if not args.workspace and not args.prefix:
-        logging.error("One of the '--workspace' or '--prefix' arguments is required.")
+    if not TFC_ORG:
+        logging.error("TFC_ORG environment variable not set")
         sys.exit(1)
 
     return args
@@ -99,14 +163,14 @@ def format_url(url: str) -> str:
     if url is None:
         url = "https://app.terraform.io/api/v2"
 
-    if not re.match(r"^http[s]?:\/\/.*?\/api\/v2", url):
+    if not _URL_RE.match(url):
         logging.error("Invalid URL: must start with http[s] and end with /api/v2")
         sys.exit(1)
 
     return url.rstrip("/")
 
 
-def create_workspace(args: argparse.Namespace) -> str:
+def create_workspace(args: argparse.Namespace, url: str) -> str:
     """
     Create a new Terraform Enterprise Workspace
 
@@ -114,14 +178,15 @@ def create_workspace(args: argparse.Namespace) -> str:
 
     :param args: CLI arguments
     :type args: argparse.Namespace
+    :param url: Organization workspaces endpoint
+    :type url: str
     :return: Workspace ID
     :rtype: str
     """
-    url = f"{format_url(args.url)}/organizations/{TFC_ORG}/workspaces"
     workspace = args.workspace
 
     if workspace is None:
-        workspace = f"{args.prefix}-{str(uuid.uuid4())}"
+        workspace = f"{args.prefix}-{secrets.token_hex(8)}"
 
     data = {
         "data": {
@@ -134,7 +199,7 @@ def create_workspace(args: argparse.Namespace) -> str:
         }
     }
 
-    response = requests.post(url, headers=HEADERS, json=data, timeout=30)
+    response = get_session().post(url, data=encode_payload(data), timeout=30)
 
     if response.status_code != 201:
         logging.error(
@@ -142,11 +207,35 @@ def create_workspace(args: argparse.Namespace) -> str:
         )
         sys.exit(1)
 
-    return response.json().get("data").get("id")
+    return response.json()["data"]["id"]
+
+
+def encode_payload(payload: dict) -> bytes:
+    """
+    Serialize a payload to a compact JSON request body
+
+    :param payload: API payload
+    :type payload: dict
+    :return: UTF-8 encoded JSON
+    :rtype: bytes
+    """
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def workspace_relationship(workspace_id: str) -> dict:
+    """
+    Create the workspace relationship shared by variable and run payloads
+
+    :param workspace_id: Workspace ID
+    :type workspace_id: str
+    :return: Relationships object
+    :rtype: dict
+    """
+    return {"workspace": {"data": {"id": workspace_id, "type": "workspaces"}}}
 
 
 def variable_payload(
-    key: str, value: str, sensitive: bool, description: str, workspace_id: str
+    key: str, value: str, sensitive: bool, description: str, relationships: dict
 ) -> dict:
     """
     Create a variable payload for API calls
@@ -161,8 +250,8 @@ def variable_payload(
     :type sensitive: bool
     :param description: Variable description
     :type description: str
-    :param workspace_id: Workspace ID
-    :type workspace_id: str
+    :param relationships: Workspace relationship, see workspace_relationship
+    :type relationships: dict
     :return: Variable payload
     :rtype: dict
     """
@@ -177,14 +266,12 @@ def variable_payload(
                 "hcl": "false",
                 "sensitive": sensitive,
             },
-            "relationships": {
-                "workspace": {"data": {"id": workspace_id, "type": "workspaces"}}
-            },
+            "relationships": relationships,
         }
     }
 
 
-def put_variables(args: argparse.Namespace, workspace_id: str):
+def put_variables(args: argparse.Namespace, url: str, workspace_id: str):
     """
     Insert variables to Terraform Workspace
 
@@ -192,83 +279,108 @@ def put_variables(args: argparse.Namespace, workspace_id: str):
 
     :param args: CLI arguments
     :type args: argparse.Namespace
+    :param url: Workspace variables endpoint
+    :type url: str
     :param workspace_id: Workspace ID
     :type workspace_id: str
     """
-    url = f"{format_url(args.url)}/workspaces/{workspace_id}/vars"
+    from concurrent.futures import ThreadPoolExecutor
+
+    import tfvars
+
+    # Built once and shared by every variable; bodies are encoded immediately
+    # so no payload outlives the loop holding a reference to it.
+    payload = functools.partial(
+        variable_payload,
+        description="",
+        relationships=workspace_relationship(workspace_id),
+    )
+    # A generator, consumed MAX_WORKERS bodies ahead of the responses below, so
+    # the first file's variables upload before the next file is parsed.
+    payloads = (
+        encode_payload(payload(key, value, sensitive))
+        for var_file, sensitive in ((args.variables, False), (args.sensitive, True))
+        if var_file
+        for key, value in tfvars.LoadSecrets(var_file).items()
+    )
+
+    session = get_session()
+    pending = collections.deque()
 
-    for var_file, sensitive in {
-        args.variables: False,
-        args.sensitive: True,
-    }.items():
-        if not var_file:
-            continue
+    def responses():
+        # At most MAX_WORKERS uploads are queued at once, so a failure stops the
+        # batch instead of waiting on every remaining variable to be sent.
+        for body in payloads:
+            pending.append(executor.submit(session.post, url, data=body, timeout=30))
 
-        tfv = tfvars.LoadSecrets(var_file)
+            if len(pending) >= MAX_WORKERS:
+                yield pending.popleft().result()
 
-        for key, value in tfv.items():
-            payload = variable_payload(key, value, sensitive, "", workspace_id)
-            response = requests.post(url, headers=HEADERS, json=payload, timeout=30)
+        while pending:
+            yield pending.popleft().result()
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        keep_alive = True
+
+        for response in responses():
+            if keep_alive and response.headers.get("Connection", "").lower() == "close":
+                logging.warning(
+                    "Put Variables: server closed the connection, keep-alive disabled"
+                )
+                keep_alive = False
 
             if response.status_code != 201:
+                for future in pending:
+                    future.cancel()
+
                 logging.error(
                     "Put Variables: Failed to put variables: %s", response.json()
                 )
                 sys.exit(1)
 
 
-def create_run(args: argparse.Namespace, workspace_id: str) -> str:
+def create_run(url: str, workspace_id: str) -> str:
     """
     Apply a Terraform Enterprise Workspace
 
     https://developer.hashicorp.com/terraform/cloud-docs/api-docs/run#create-a-run
 
-    :param args: CLI arguments
-    :type args: argparse.Namespace
+    :param url: Runs endpoint
+    :type url: str
     :param workspace_id: Workspace ID
     :type workspace_id: str
     :return: Run ID
     :rtype: str
     """
-    url = f"{format_url(args.url)}/runs"
     payload = {
         "data": {
             "type": "runs",
             "attributes": {"auto-apply": "true"},
-            "relationships": {
-                "workspace": {"data": {"id": workspace_id, "type": "workspaces"}}
-            },
+            "relationships": workspace_relationship(workspace_id),
         }
     }
 
-    response = requests.post(url, headers=HEADERS, json=payload, timeout=30)
+    response = get_session().post(url, data=encode_payload(payload), timeout=30)
 
     if response.status_code != 201:
         logging.error("Create Run: Failed to create run: %s", response.json())
         sys.exit(1)
 
-    return response.json().get("data").get("id")
+    return response.json()["data"]["id"]
 
 
 def main():
     """Main"""
-    if not TFC_TOKEN:
-        logging.error("TFC_TOKEN environment variable not set")
-        sys.exit(1)
-
-    if not TFC_ORG:
-        logging.error("TFC_ORG environment variable not set")
-        sys.exit(1)
-
     args = cli()
-    workspace = create_workspace(args)
-    put_variables(args, workspace)
-    run_id = create_run(args, workspace)
+    base_url = format_url(args.url)
+    workspace = create_workspace(args, f"{base_url}/organizations/{TFC_ORG}/workspaces")
+    put_variables(args, f"{base_url}/workspaces/{workspace}/vars", workspace)
+    run_id = create_run(f"{base_url}/runs", workspace)
 
     output = {
         "workspace": workspace,
         "run_id": run_id,
-        "url": f"{format_url(args.url)}/app/{TFC_ORG}/workspaces/{workspace}/runs/{run_id}",
+        "url": f"{base_url}/app/{TFC_ORG}/workspaces/{workspace}/runs/{run_id}",
     }
 
     logging.info(output)
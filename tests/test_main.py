@@ -0,0 +1,90 @@
+import argparse
+import json
+import sys
+import types
+import unittest
+from unittest import mock
+
+import main
+
+URL = "https://app.terraform.io/api/v2/workspaces/ws-1/vars"
+
+
+class FakeResponse:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.headers = {}
+
+    def json(self) -> dict:
+        return {"errors": [{"status": str(self.status_code)}]}
+
+
+class PutVariablesTest(unittest.TestCase):
+    def setUp(self):
+        self.files = {}
+        self.failing = set()
+
+        tfv = types.ModuleType("tfvars")
+        tfv.LoadSecrets = mock.Mock(side_effect=lambda path: self.files[path])
+        modules = mock.patch.dict(sys.modules, {"tfvars": tfv})
+        modules.start()
+        self.addCleanup(modules.stop)
+        self.load_secrets = tfv.LoadSecrets
+
+        self.session = mock.Mock()
+        self.session.post.side_effect = self.post
+        session = mock.patch.object(main, "get_session", return_value=self.session)
+        session.start()
+        self.addCleanup(session.stop)
+
+    def post(self, url, data, timeout):
+        key = json.loads(data)["data"]["attributes"]["key"]
+        return FakeResponse(422 if key in self.failing else 201)
+
+    def put_variables(self, variables=None, sensitive=None):
+        args = argparse.Namespace(variables=variables, sensitive=sensitive)
+        main.put_variables(args, URL, "ws-1")
+
+    def test_uploads_every_variable(self):
+        self.files["vars.tfvars"] = {f"var{i}": "value" for i in range(20)}
+        self.files["secret.tfvars"] = {f"secret{i}": "value" for i in range(5)}
+
+        self.put_variables("vars.tfvars", "secret.tfvars")
+
+        self.assertEqual(self.session.post.call_count, 25)
+
+    def test_stops_uploading_after_first_failure(self):
+        self.files["vars.tfvars"] = {f"var{i}": "value" for i in range(40)}
+        self.failing.add("var0")
+
+        with self.assertLogs(level="ERROR"), self.assertRaises(SystemExit):
+            self.put_variables("vars.tfvars")
+
+        self.assertLessEqual(self.session.post.call_count, main.MAX_WORKERS)
+
+    def test_failure_in_variables_skips_sensitive_file(self):
+        self.files["vars.tfvars"] = {f"var{i}": "value" for i in range(20)}
+        self.files["secret.tfvars"] = {f"secret{i}": "value" for i in range(5)}
+        self.failing.add("var0")
+
+        with self.assertLogs(level="ERROR"), self.assertRaises(SystemExit):
+            self.put_variables("vars.tfvars", "secret.tfvars")
+
+        self.load_secrets.assert_called_once_with("vars.tfvars")
+        for call in self.session.post.call_args_list:
+            self.assertNotIn(b"secret", call.kwargs["data"])
+
+
+class GetSessionTest(unittest.TestCase):
+    def setUp(self):
+        main.get_session.cache_clear()
+        self.addCleanup(main.get_session.cache_clear)
+
+    def test_missing_token_exits(self):
+        with mock.patch.dict("os.environ", clear=True):
+            with self.assertLogs(level="ERROR"), self.assertRaises(SystemExit):
+                main.get_session()
+
+
+if __name__ == "__main__":
+    unittest.main()